@@ -1,16 +1,56 @@
 import dash_mantine_components as dmc
-from dash import Dash, html, callback, Input, Output, dcc, dash_table
+from dash import Dash, html, callback, ctx, no_update, Input, Output, State, dcc, dash_table
+from dash.exceptions import PreventUpdate
 import base64
 import pandas as pd
 import dash_table
 import dash_pivottable
 
-import io
-import plotly.express as px
+import itertools
+import os
+import threading
+import time
+import uuid
+import plotly.graph_objects as go
+
+from schemas import registry
+from streaming import FileTail, IncrementalFrame, SessionCache
+
+# Local CSV files to tail for new rows, e.g. TAIL_FILES=data/tsla-live.csv
+tail_paths = [path for path in os.environ.get("TAIL_FILES", "").split(os.pathsep) if path]
+
+# The pivot table gets the whole dataset, so streamed rows are sent to it at most this often
+PIVOT_REFRESH_SECONDS = 10
+
+
+class SessionData:
+    """
+    The merged data of a session's last upload, kept so new rows can be appended to
+    it, and the schemas of the files it was built from, in the order they are graphed.
+    Callbacks hold `lock` while they read or replace any of it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frame = None
+        self.schemas = []
+        # Each session tails the files itself, so every session sees every new row
+        self.tail_sources = [FileTail(path) for path in tail_paths]
+        self.pivot_revision = 0
+        self.pivot_sent_at = 0.0
+        # Counts the loads, so streamed rows are only sent once the page has the
+        # figures of the current load
+        self.load_revision = 0
+
+
+sessions = SessionCache(SessionData)
+
+# Roles compared between each pair of tickers in the correlation table
+correlation_roles = {"Open": "open", "Close": "close", "Volume": "volume"}
 
 app = Dash(__name__)
 
-app.layout = dmc.MantineProvider(
+layout = dmc.MantineProvider(
     [
         dmc.Header(
             height="10%",
@@ -68,6 +108,16 @@ app.layout = dmc.MantineProvider(
                                     # Allow multiple files to be uploaded
                                     multiple=True,
                                 ),
+                                dmc.Switch(
+                                    id="append-mode",
+                                    label="Append to loaded data",
+                                    checked=False,
+                                    style={"display": "inline-block", "margin": "10px"},
+                                ),
+                                html.Div(
+                                    id="upload-message",
+                                    style={"color": "#c0392b", "margin": "0 10px"},
+                                ),
                             ],
                             style={"text-align": "right", "padding": "10px"},
                         ),
@@ -91,7 +141,8 @@ app.layout = dmc.MantineProvider(
                     ### Using this app
                     1.  Click the "Upload Files" button in the upper right corner of this app.
                     2.  Upload the Tesla Stock and S&P500 data linked above from your Downloads folder.
-                    3.  When uploaded, scroll below to see automatically generated graphs and a correlation table. **Note** - _this will only work for these two datasets_.
+                    3.  When uploaded, scroll below to see automatically generated graphs and a correlation table. **Note** - _files are matched by their columns, so this will only work for the Tesla and S&P500 datasets, and for stock data downloaded from Nasdaq like the Ford data, which is named after its file_.
+                    4.  To add new rows, turn on **Append to loaded data** and upload files with just the new rows. They are merged into the loaded data and the graphs grow in place.
                     """
                 ),
             ],
@@ -122,186 +173,325 @@ app.layout = dmc.MantineProvider(
                 "padding": "10px"
             },  # Add some padding around the Center for better spacing
         ),
-        html.Div(id="graph-output"),  # Container for the graphs
+        html.Div(
+            id="graph-output",  # Container for the graphs
+            children=[
+                dash_table.DataTable(
+                    id="correlation-values",
+                    style_cell={"textAlign": "center"},
+                ),
+                dmc.Group(
+                    children=[
+                        dcc.Graph(id="close-graph"),
+                        dcc.Graph(id="volume-graph"),
+                    ],
+                    position="center",
+                    grow=True,
+                ),
+                dcc.Graph(id="ma-graph"),
+            ],
+            style={"display": "none"},
+        ),
+        dcc.Interval(
+            id="tail-interval", interval=1000, disabled=len(tail_paths) == 0
+        ),
+        dcc.Store(id="load-revision"),
         dash_table.DataTable(id="correlation-table"),
     ]
 )
 
 
+def serve_layout():
+    # Every page load gets its own session id, so each browser tab keeps its own data
+    return html.Div([dcc.Store(id="session-id", data=str(uuid.uuid4())), layout])
+
+
+app.layout = serve_layout
+
+
 def empty_dataframe_list():
     return [["No Data"]]
 
 
-def empty_div():
-    return html.Div("")
+def empty_output(session, message=""):
+    # Forget the loaded data, so nothing is streamed into the now empty graphs
+    with session.lock:
+        session.frame = None
+        session.schemas = []
+
+    return (
+        {"display": "none"},
+        [],
+        {},
+        {},
+        {},
+        empty_dataframe_list(),
+        html.Div(),
+        no_update,
+        message,
+    )
+
+
+def decode_text(decoded):
+    try:
+        # Try UTF-8 decoding first
+        return decoded.decode("utf-8")
+    except UnicodeDecodeError:
+        # If UTF-8 fails, fall back to ISO-8859-1 decoding
+        return decoded.decode("ISO-8859-1")
+
+
+def parse_text(text, filename=None):
+    """
+    Returns the schema of the file and its parsed data, or None if the file doesn't
+    match a known schema or can't be parsed with it.
+    """
+    try:
+        return registry.parse(text, filename)
+    except (ValueError, pd.errors.ParserError):
+        return None
+
+
+def parse_contents(content, filename=None):
+    content_type, content_string = content.split(",")
+    return parse_text(decode_text(base64.b64decode(content_string)), filename)
+
+
+def parse_uploads(uploaded_contents, filenames):
+    filenames = filenames or [None] * len(uploaded_contents)
+    return [
+        parse_contents(content, filename)
+        for content, filename in zip(uploaded_contents, filenames)
+    ]
+
+
+def match_loaded_ticker(parsed, schemas):
+    """
+    Names the data of a file in a format shared by many tickers, like the Nasdaq one,
+    after the loaded ticker in that format when it is the only one, so new rows can
+    be appended from a file with any name.
+    """
+    if parsed is None:
+        return None
+
+    schema, df = parsed
+    loaded = [loaded for loaded in schemas if loaded.fingerprint == schema.fingerprint]
+    if (
+        not registry.registered(schema).ticker_from_filename
+        or len(loaded) != 1
+        or loaded[0].ticker == schema.ticker
+    ):
+        return parsed
+
+    renames = {schema.column(role): loaded[0].column(role) for role in schema.columns}
+    return loaded[0], df.rename(columns=renames)
+
+
+def parse_appends(uploaded_contents, filenames, schemas):
+    """
+    Parses files to append to the data loaded for `schemas`. Returns them with a
+    message for the user if any of them can't be appended, or None if all can.
+    """
+    parsed = [
+        match_loaded_ticker(match, schemas)
+        for match in parse_uploads(uploaded_contents, filenames)
+    ]
+
+    tickers = {schema.ticker for schema in schemas}
+    for match, filename in zip(parsed, filenames or [None] * len(parsed)):
+        name = filename or "A file"
+        if match is None:
+            return parsed, f"{name} doesn't match the columns of any known dataset."
+        if match[0].ticker not in tickers:
+            return parsed, (
+                f"{name} is for {match[0].label}, which isn't in the loaded data. "
+                "Turn off append mode to load it."
+            )
+
+    return parsed, duplicate_ticker_message(parsed)
+
+
+def duplicate_ticker_message(parsed):
+    """
+    Returns a message for the user if several of the parsed files are for the same
+    ticker, as their prices would otherwise overwrite each other.
+    """
+    tickers = set()
+    for schema, df in filter(None, parsed):
+        if schema.ticker in tickers:
+            return (
+                f"Several files were uploaded for {schema.label}. "
+                "Upload one file per ticker."
+            )
+        tickers.add(schema.ticker)
+    return None
+
+
+def correlation_records(frame, schemas):
+    return [
+        {
+            "Metric": metric,
+            "Tickers": f"{first.label} / {second.label}",
+            "Pearson Correlation": frame.correlation(
+                first.column(role), second.column(role)
+            ),
+        }
+        for first, second in itertools.combinations(schemas, 2)
+        for metric, role in correlation_roles.items()
+    ]
+
+
+def comparison_figure(schemas, series, title, axis_title):
+    """
+    Plots one trace per ticker, each over its own dates so new points can be added
+    to the end of it. The first ticker uses the left axis and the others the right.
+    """
+    fig = go.Figure()
+    names = [f"{schema.label} {axis_title}" for schema in schemas]
+    for index, (name, values) in enumerate(zip(names, series)):
+        fig.add_scatter(
+            x=values.index,
+            y=values.values,
+            mode="lines",
+            name=name,
+            yaxis="y" if index == 0 else "y2",
+        )
+    fig.update_layout(
+        title=title,
+        xaxis=dict(title="Date"),
+        yaxis=dict(title=names[0]),
+        yaxis2=dict(title=", ".join(names[1:]), overlaying="y", side="right"),
+    )
+    return fig
+
+
+def extend_data(points, columns):
+    """
+    Builds a dcc.Graph extendData value that appends the new points of each column
+    to the trace at the same position in `columns`.
+    """
+    indices = [index for index, column in enumerate(columns) if column in points]
+    if len(indices) == 0:
+        return no_update
+
+    return [
+        dict(
+            x=[points[columns[index]][0] for index in indices],
+            y=[points[columns[index]][1] for index in indices],
+        ),
+        indices,
+    ]
 
 
 @callback(
-    Output("graph-output", "children"),
+    Output("graph-output", "style"),
+    Output("correlation-values", "data"),
+    Output("close-graph", "figure"),
+    Output("volume-graph", "figure"),
+    Output("ma-graph", "figure"),
     Output("pivot-table", "data"),
     Output("data_analysis_title", "children"),
+    Output("load-revision", "data"),
+    Output("upload-message", "children"),
     Input("upload-data", "contents"),
+    State("upload-data", "filename"),
+    State("append-mode", "checked"),
+    State("session-id", "data"),
 )
-def update_output(uploaded_contents):
-    if uploaded_contents is None or len(uploaded_contents) != 2:
-        return (
-            empty_div(),
-            empty_dataframe_list(),
-            html.Div(),
-        )
+def update_output(uploaded_contents, filenames, append_mode, session_id):
+    session = sessions.get(session_id)
 
-    dataframes = []
-    for content in uploaded_contents:
-        content_type, content_string = content.split(",")
-        decoded = base64.b64decode(content_string)
-
-        try:
-            # Try UTF-8 decoding first
-            df = pd.read_csv(io.StringIO(decoded.decode("utf-8")))
-        except UnicodeDecodeError:
-            try:
-                # If UTF-8 fails, try ISO-8859-1 decoding
-                df = pd.read_csv(io.StringIO(decoded.decode("ISO-8859-1")))
-            except:
-                return (
-                    empty_div(),
-                    empty_dataframe_list(),
-                    html.Div(),
-                )
-
-        dataframes.append(df)
-
-    # Define column sets for each schema
-    schema1_columns = set(
-        ["Date", "open_sp", "high_sp", "low_sp", "close_sp", "volume_sp"]
-    )
-    schema2_columns = set(
-        ["Date", "close_tsla", "volume_tsla", "open_tsla", "high_tsla", "low_tsla"]
-    )
+    # In append mode, new uploads are merged into the loaded data by stream_output,
+    # which skips uploads with files it can't append, so the user is told here.
+    # Only the message is updated, so the rest of the page is left as it is.
+    with session.lock:
+        if append_mode and session.frame is not None:
+            parsed, message = parse_appends(
+                uploaded_contents or [], filenames, session.schemas
+            )
+            return (no_update,) * 8 + (message or "",)
 
-    # Identify dataframes based on columns
-    if set(dataframes[0].columns) == schema1_columns:
-        df_sp = dataframes[0]
-        df_tsla = dataframes[1]
-    elif set(dataframes[0].columns) == schema2_columns:
-        df_sp = dataframes[1]
-        df_tsla = dataframes[0]
-    else:
-        return (
-            empty_div(),
-            empty_dataframe_list(),
-            html.Div(),
-        )
+    if uploaded_contents is None or len(uploaded_contents) == 0:
+        return empty_output(session)
 
-    # Convert date columns (for safety, in case they're not in datetime format)
-    df_sp["Date"] = pd.to_datetime(df_sp["Date"])
-    df_tsla["Date"] = pd.to_datetime(df_tsla["Date"])
+    # Route each file to its schema by its header, skipping files that match none
+    parsed = parse_uploads(uploaded_contents, filenames)
+    message = duplicate_ticker_message(parsed)
+    if message is not None:
+        return empty_output(session, message)
 
-    # Merge using an outer join on the Date column
-    merged_df = df_sp.merge(df_tsla, on="Date", how="outer")
-    cols_to_convert = [col for col in merged_df.columns if col != "Date"]
-    merged_df[cols_to_convert] = merged_df[cols_to_convert].astype(float)
-    merged_df_list = [merged_df.columns.tolist()] + merged_df.values.tolist()
+    dataframes = {schema: df for schema, df in filter(None, parsed)}
+    if len(dataframes) == 0:
+        return empty_output(session)
 
-    if not merged_df.empty:
-        # Time Series Plot for Closing Prices
-        fig1 = px.line(
-            merged_df,
-            x="Date",
-            y="close_sp",
-            labels={"close_sp": "S&P Close Price"},
-            title="Close Price Comparison",
-        )
-        fig1.add_scatter(
-            x=merged_df["Date"],
-            y=merged_df["close_tsla"],
-            mode="lines",
-            name="TSLA Close Price",
-            yaxis="y2",
-        )
-        fig1.update_layout(
-            yaxis=dict(title="S&P Close Price"),
-            yaxis2=dict(title="TSLA Close Price", overlaying="y", side="right"),
-        )
+    # Merge on the Date column, using the join of each schema
+    schemas = sorted(dataframes, key=registry.position)
+    merged_df = None
+    for schema in schemas:
+        df = dataframes[schema].groupby("Date", as_index=False, sort=False).last()
+        if merged_df is None:
+            merged_df = df
+        else:
+            merged_df = merged_df.merge(df, on="Date", how=schema.join)
 
-        # Volume Bar Chart
-        fig2 = px.line(
-            merged_df,
-            x="Date",
-            y="volume_sp",
-            labels={"volume_sp": "S&P Volume"},
-            title="Trading Volume Comparison",
-        )
+    merged_df = merged_df.sort_values("Date", ignore_index=True)
+    merged_df_list = [merged_df.columns.tolist()] + merged_df.values.tolist()
 
-        # Add TSLA volume with secondary y-axis
-        fig2.add_scatter(
-            x=merged_df["Date"],
-            y=merged_df["volume_tsla"],
-            mode="lines",
-            name="TSLA Volume",
-            yaxis="y2",
-        )
+    if merged_df.empty:
+        return empty_output(session)
 
-        # Update layout to specify y-axis properties
-        fig2.update_layout(
-            yaxis=dict(title="S&P Volume"),
-            yaxis2=dict(title="TSLA Volume", overlaying="y", side="right"),
-        )
+    # Keep the merged data, with running statistics, so new rows can be appended later.
+    # It is only handed to the session once its statistics are set up.
+    frame = IncrementalFrame(merged_df, date_column="Date", window=30)
+    for schema in schemas:
+        frame.track_rolling_mean(schema.column("close"))
+    for first, second in itertools.combinations(schemas, 2):
+        for role in correlation_roles.values():
+            frame.track_correlation(first.column(role), second.column(role))
 
-        # Moving Average Plot
-        merged_df["S&P_MA30"] = merged_df["close_sp"].rolling(window=30).mean()
-        merged_df["TSLA_MA30"] = merged_df["close_tsla"].rolling(window=30).mean()
-        fig3 = px.line(
-            merged_df,
-            x="Date",
-            y="S&P_MA30",
-            labels={"S&P_MA30": "S&P 30-Day MA"},
-            title="30-Day Moving Average Comparison",
+    # The figures and correlations are built under the lock, and the frame is only
+    # handed to the session after them, so no streamed rows can be missed by either
+    with session.lock:
+        # Each column is plotted over its own dates, so new points can be added to the end of its trace
+        def series(role):
+            return [
+                merged_df.set_index("Date")[schema.column(role)].dropna()
+                for schema in schemas
+            ]
+
+        # Time Series Plot for Closing Prices
+        fig1 = comparison_figure(
+            schemas, series("close"), "Close Price Comparison", "Close Price"
         )
 
-        fig3.add_scatter(
-            x=merged_df["Date"],
-            y=merged_df["TSLA_MA30"],
-            mode="lines",
-            name="TSLA 30-Day MA",
-            yaxis="y2",
+        # Volume Chart
+        fig2 = comparison_figure(
+            schemas, series("volume"), "Trading Volume Comparison", "Volume"
         )
 
-        fig3.update_layout(
-            yaxis=dict(title="S&P 30-Day Moving Average"),
-            yaxis2=dict(
-                title="TSLA 30-Day Moving Average", overlaying="y", side="right"
-            ),
+        # Moving Average Plot
+        fig3 = comparison_figure(
+            schemas,
+            [close.rolling(window=frame.window).mean() for close in series("close")],
+            "30-Day Moving Average Comparison",
+            "30-Day Moving Average",
         )
-        # Compute the correlation coefficients
-        correlations = {
-            "Metric": ["Open", "Close", "Volume"],
-            "Pearson Correlation": [
-                merged_df["open_sp"].corr(merged_df["open_tsla"]),
-                merged_df["close_sp"].corr(merged_df["close_tsla"]),
-                merged_df["volume_sp"].corr(merged_df["volume_tsla"]),
-            ],
-        }
 
-        correlations_df = pd.DataFrame(correlations)
+        correlations = correlation_records(frame, schemas)
 
-        layout = [
-            dash_table.DataTable(
-                data=correlations_df.to_dict("records"),
-                style_cell={"textAlign": "center"},
-            ),
-            dmc.Group(
-                children=[dcc.Graph(figure=fig1), dcc.Graph(figure=fig2)],
-                position="center",
-                grow=True,
-            ),
-            dcc.Graph(figure=fig3),
-        ]
-    else:
-        layout = []
+        session.frame = frame
+        session.schemas = schemas
+        session.pivot_revision = frame.revision
+        session.pivot_sent_at = time.monotonic()
+        session.load_revision += 1
+        load_revision = session.load_revision
 
     return (
-        layout,
+        {"display": "block"},
+        correlations,
+        fig1,
+        fig2,
+        fig3,
         merged_df_list,
         html.Div(  # Add a container for the section below the pivot table
             className="data-table-container",
@@ -329,8 +519,91 @@ def update_output(uploaded_contents):
                 "width": "100%",
             },
         ),
+        load_revision,
+        "",
     )
 
 
+@callback(
+    Output("close-graph", "extendData"),
+    Output("volume-graph", "extendData"),
+    Output("ma-graph", "extendData"),
+    Output("correlation-values", "data", allow_duplicate=True),
+    Output("pivot-table", "data", allow_duplicate=True),
+    Input("tail-interval", "n_intervals"),
+    Input("upload-data", "contents"),
+    State("upload-data", "filename"),
+    State("append-mode", "checked"),
+    State("session-id", "data"),
+    State("load-revision", "data"),
+    prevent_initial_call=True,
+)
+def stream_output(
+    n_intervals, uploaded_contents, filenames, append_mode, session_id, load_revision
+):
+    session = sessions.get(session_id)
+
+    with session.lock:
+        # Wait until the page has the figures of the current load, as the points
+        # would otherwise go to figures that are about to be replaced
+        if session.frame is None or load_revision != session.load_revision:
+            raise PreventUpdate
+
+        if ctx.triggered_id == "upload-data":
+            if not append_mode or uploaded_contents is None:
+                raise PreventUpdate
+            parsed, message = parse_appends(
+                uploaded_contents, filenames, session.schemas
+            )
+            if message is not None:
+                raise PreventUpdate
+        else:
+            parsed = []
+            for source in session.tail_sources:
+                data = source.read()
+                if data is not None:
+                    filename = os.path.basename(source.path)
+                    parsed.append(
+                        match_loaded_ticker(
+                            parse_text(decode_text(data), filename), session.schemas
+                        )
+                    )
+
+        new_rows = [df for schema, df in filter(None, parsed)]
+        points, rolling_means = {}, {}
+        if len(new_rows) > 0:
+            points, rolling_means = session.frame.append(pd.concat(new_rows))
+
+        # Resending the whole dataset costs as much as the history is long, so the
+        # pivot table is only refreshed when the data changed, and not too often
+        # while streaming from the tailed files
+        pivot_data = no_update
+        now = time.monotonic()
+        if session.frame.revision != session.pivot_revision and (
+            ctx.triggered_id == "upload-data"
+            or now - session.pivot_sent_at >= PIVOT_REFRESH_SECONDS
+        ):
+            merged_df = session.frame.to_frame()
+            pivot_data = [merged_df.columns.tolist()] + merged_df.values.tolist()
+            session.pivot_revision = session.frame.revision
+            session.pivot_sent_at = now
+
+        if len(points) == 0:
+            if pivot_data is no_update:
+                raise PreventUpdate
+            return no_update, no_update, no_update, no_update, pivot_data
+
+        close_columns = [schema.column("close") for schema in session.schemas]
+        volume_columns = [schema.column("volume") for schema in session.schemas]
+
+        return (
+            extend_data(points, close_columns),
+            extend_data(points, volume_columns),
+            extend_data(rolling_means, close_columns),
+            correlation_records(session.frame, session.schemas),
+            pivot_data,
+        )
+
+
 if __name__ == "__main__":
     app.run_server(debug=True)
@@ -0,0 +1,219 @@
+import csv
+import hashlib
+import io
+import os
+import re
+
+import pandas as pd
+
+# Roles every schema needs so its data can be graphed and compared
+REQUIRED_ROLES = ["date", "open", "close", "volume"]
+
+
+def header_fingerprint(columns):
+    """
+    Hashes the column names of a header, ignoring their order, case and surrounding
+    whitespace, so any file with the same columns gets the same fingerprint.
+    """
+    normalized = sorted(str(column).strip().lower() for column in columns)
+    return hashlib.sha1("\x1f".join(normalized).encode("utf-8")).hexdigest()
+
+
+class Schema:
+    """
+    Describes one kind of uploaded file:
+    - columns: the column in the file for each role (date, open, high, low, close, volume)
+    - date_format: how the dates are written, or None to let pandas infer it
+    - strip_characters: characters removed from numbers before parsing them, like "$"
+    - thousands: the thousands separator used in numbers, if any
+    - ticker: the suffix the columns are renamed with, e.g. close_tsla
+    - label: the name of the ticker shown in graphs and tables
+    - join: how the data is merged with the other uploads on the date
+    - ticker_from_filename: for generic formats shared by many tickers, take the
+      ticker and label from the name of each file instead
+    """
+
+    def __init__(
+        self,
+        ticker,
+        label,
+        columns,
+        date_format=None,
+        strip_characters="",
+        thousands=None,
+        join="outer",
+        ticker_from_filename=False,
+    ):
+        missing_roles = [role for role in REQUIRED_ROLES if role not in columns]
+        if len(missing_roles) > 0:
+            raise ValueError(f"Schema {ticker} is missing the roles {missing_roles}")
+
+        self.ticker = ticker
+        self.label = label
+        self.columns = columns
+        self.date_format = date_format
+        self.strip_characters = strip_characters
+        self.thousands = thousands
+        self.join = join
+        self.ticker_from_filename = ticker_from_filename
+        self.fingerprint = header_fingerprint(columns.values())
+
+        # Built once here, so parsing a file doesn't need to work any of this out again
+        self.renames = {
+            column.strip().lower(): self.column(role) for role, column in columns.items()
+        }
+        self.strip_pattern = (
+            re.compile(f"[{re.escape(strip_characters)}]") if strip_characters else None
+        )
+
+    def column(self, role):
+        """
+        Returns the name of the column for `role` once the data is parsed.
+        """
+        return "Date" if role == "date" else f"{role}_{self.ticker}"
+
+    def for_file(self, filename):
+        """
+        Returns the schema to parse `filename` with. For a schema that takes its
+        ticker from the file name, this is a copy named after the file, so for
+        example "Ford Data.csv" is labelled Ford Data with columns like close_ford_data.
+        """
+        if not self.ticker_from_filename or not filename:
+            return self
+
+        label = os.path.splitext(os.path.basename(filename))[0].strip()
+        ticker = re.sub(r"\W+", "_", label.lower()).strip("_")
+        if not ticker:
+            return self
+
+        return Schema(
+            ticker,
+            label,
+            self.columns,
+            date_format=self.date_format,
+            strip_characters=self.strip_characters,
+            thousands=self.thousands,
+            join=self.join,
+        )
+
+    def parse(self, text):
+        df = pd.read_csv(io.StringIO(text), thousands=self.thousands)
+        df.columns = [self.renames[column.strip().lower()] for column in df.columns]
+
+        df["Date"] = pd.to_datetime(df["Date"], format=self.date_format)
+        for column in df.columns:
+            if column == "Date":
+                continue
+            if self.strip_pattern is not None and not pd.api.types.is_numeric_dtype(
+                df[column]
+            ):
+                df[column] = df[column].str.replace(self.strip_pattern, "", regex=True)
+            df[column] = df[column].astype(float)
+
+        return df
+
+
+class SchemaRegistry:
+    """
+    Matches uploaded files to schemas with a single lookup on the fingerprint of
+    their header, instead of trying to parse each file with every schema.
+    """
+
+    def __init__(self):
+        self.schemas = {}
+        self.positions = {}
+
+    def register(self, schema):
+        if schema.fingerprint in self.schemas:
+            raise ValueError(f"Schema {schema.ticker} has the same columns as another schema")
+
+        self.positions[schema.fingerprint] = len(self.schemas)
+        self.schemas[schema.fingerprint] = schema
+        return schema
+
+    def position(self, schema):
+        """
+        Returns the order `schema` was registered in, then its ticker, which is the
+        order tickers are graphed in.
+        """
+        return self.positions[schema.fingerprint], schema.ticker
+
+    def registered(self, schema):
+        """
+        Returns the registered schema with the columns of `schema`, which for a schema
+        named after its file is the one it was made from.
+        """
+        return self.schemas[schema.fingerprint]
+
+    def match(self, text):
+        header = next(csv.reader(io.StringIO(text)), None)
+        if header is None:
+            return None
+        return self.schemas.get(header_fingerprint(header))
+
+    def parse(self, text, filename=None):
+        """
+        Returns the schema matching the header of `text`, named after `filename` if
+        it takes its ticker from the file name, and the parsed data, or None if no
+        schema matches.
+        """
+        schema = self.match(text)
+        if schema is None:
+            return None
+        schema = schema.for_file(filename)
+        return schema, schema.parse(text)
+
+
+registry = SchemaRegistry()
+
+registry.register(
+    Schema(
+        ticker="sp",
+        label="S&P",
+        columns={
+            "date": "Date",
+            "open": "open_sp",
+            "high": "high_sp",
+            "low": "low_sp",
+            "close": "close_sp",
+            "volume": "volume_sp",
+        },
+        date_format="%b %d, %Y",
+    )
+)
+
+registry.register(
+    Schema(
+        ticker="tsla",
+        label="TSLA",
+        columns={
+            "date": "Date",
+            "open": "open_tsla",
+            "high": "high_tsla",
+            "low": "low_tsla",
+            "close": "close_tsla",
+            "volume": "volume_tsla",
+        },
+        date_format="%Y/%m/%d",
+    )
+)
+
+# The format of stock data downloaded from Nasdaq, like the Ford data, which is the
+# same for every ticker
+registry.register(
+    Schema(
+        ticker="nasdaq",
+        label="Nasdaq",
+        columns={
+            "date": "Date",
+            "open": "Open",
+            "high": "High",
+            "low": "Low",
+            "close": "Close/Last",
+            "volume": "Volume",
+        },
+        date_format="%m/%d/%Y",
+        strip_characters="$",
+        ticker_from_filename=True,
+    )
+)
@@ -0,0 +1,266 @@
+import math
+import os
+import threading
+from collections import OrderedDict, deque
+
+import pandas as pd
+
+
+class RollingMean:
+    """
+    Keeps the mean of the last `window` values from a running sum, so each new
+    value is an O(1) update instead of a full `rolling(window).mean()` recompute.
+    Like pandas, the mean is None until the window is full.
+    """
+
+    def __init__(self, window, values=()):
+        self.window = window
+        self.values = deque(list(values)[-window:])
+        self.total = math.fsum(self.values)
+        self.pushes = 0
+
+    def push(self, value):
+        self.values.append(value)
+        self.total += value
+        if len(self.values) > self.window:
+            self.total -= self.values.popleft()
+
+        # Re-sum once per window so floating point drift can't build up over a long stream
+        self.pushes += 1
+        if self.pushes % self.window == 0:
+            self.total = math.fsum(self.values)
+
+        return self.mean
+
+    @property
+    def mean(self):
+        if len(self.values) < self.window:
+            return None
+        return self.total / self.window
+
+
+class RunningCorrelation:
+    """
+    Pearson correlation over every (x, y) pair seen so far, updated in O(1) per pair
+    from running means and co-moments (Welford's method), which stays accurate for
+    large values such as trading volumes.
+    """
+
+    def __init__(self, x=(), y=()):
+        x = pd.Series(x, dtype=float)
+        y = pd.Series(y, dtype=float)
+        self.count = len(x)
+        self.mean_x = x.mean() if self.count else 0.0
+        self.mean_y = y.mean() if self.count else 0.0
+        self.m2_x = ((x - self.mean_x) ** 2).sum()
+        self.m2_y = ((y - self.mean_y) ** 2).sum()
+        self.c_xy = ((x - self.mean_x).values * (y - self.mean_y).values).sum()
+
+    def push(self, x, y):
+        self.count += 1
+        dx = x - self.mean_x
+        self.mean_x += dx / self.count
+        dy = y - self.mean_y
+        self.mean_y += dy / self.count
+        self.m2_x += dx * (x - self.mean_x)
+        self.m2_y += dy * (y - self.mean_y)
+        self.c_xy += dx * (y - self.mean_y)
+
+    @property
+    def value(self):
+        if self.count < 2 or self.m2_x <= 0 or self.m2_y <= 0:
+            return float("nan")
+        return self.c_xy / math.sqrt(self.m2_x * self.m2_y)
+
+
+class IncrementalFrame:
+    """
+    A merged dataframe that only grows. New rows for known columns are merged in by
+    date, and the tracked rolling means and correlations are updated from running
+    sums rather than recomputed over the whole history.
+
+    Each column is treated as its own series: a value is only accepted if it is
+    newer than the last value already held for that column, so every graph trace
+    can be extended at its end.
+    """
+
+    def __init__(self, df, date_column="Date", window=30):
+        self.date_column = date_column
+        self.window = window
+        self.frame = df.set_index(date_column).sort_index()
+        self.last_dates = {
+            column: self.frame[column].last_valid_index()
+            for column in self.frame.columns
+        }
+        self.rolling_means = {}
+        self.correlations = {}
+
+        # Rows for dates that aren't in the frame yet. They are only added to it when
+        # the whole frame is needed, so appending doesn't copy the full history.
+        self.new_rows = {}
+
+        # Counts the accepted values, so callers can tell when the frame has changed
+        self.revision = 0
+
+    def track_rolling_mean(self, column):
+        self.rolling_means[column] = RollingMean(
+            self.window, self.frame[column].dropna()
+        )
+
+    def track_correlation(self, first_column, second_column):
+        pairs = self.frame[[first_column, second_column]].dropna()
+        self.correlations[(first_column, second_column)] = RunningCorrelation(
+            pairs[first_column], pairs[second_column]
+        )
+
+    def correlation(self, first_column, second_column):
+        return self.correlations[(first_column, second_column)].value
+
+    def value(self, date, column):
+        if date in self.new_rows:
+            return self.new_rows[date].get(column, float("nan"))
+        if date in self.frame.index:
+            return self.frame.at[date, column]
+        return float("nan")
+
+    def to_frame(self):
+        if len(self.new_rows) > 0:
+            new_rows = pd.DataFrame.from_dict(
+                self.new_rows, orient="index", columns=self.frame.columns, dtype=float
+            )
+            needs_sort = (
+                len(self.frame) > 0 and new_rows.index.min() <= self.frame.index[-1]
+            )
+            self.frame = pd.concat([self.frame, new_rows.sort_index()])
+            if needs_sort:
+                self.frame = self.frame.sort_index()
+            self.new_rows = {}
+
+        return self.frame.rename_axis(self.date_column).reset_index()
+
+    def append(self, rows):
+        """
+        Merges `rows` into the frame and returns the newly accepted points, as a
+        dictionary from column to (dates, values), along with the new rolling mean
+        points for every tracked column that received values.
+        """
+        points, rolling_means = {}, {}
+        if self.date_column not in rows.columns:
+            return points, rolling_means
+
+        rows = rows[
+            [
+                col
+                for col in rows.columns
+                if col in self.frame.columns or col == self.date_column
+            ]
+        ]
+        rows = rows.assign(
+            **{self.date_column: pd.to_datetime(rows[self.date_column], errors="coerce")}
+        )
+        rows = rows.dropna(subset=[self.date_column]).sort_values(
+            self.date_column, kind="stable"
+        )
+
+        # Like a full load, the last value given for a date wins. Rows of different
+        # tickers can share a date, so this is decided per column.
+        rows = rows.groupby(self.date_column, as_index=False, sort=False).last()
+
+        for row in rows.to_dict("records"):
+            date = row.pop(self.date_column)
+            filled = []
+            for column, value in row.items():
+                if pd.isna(value):
+                    continue
+                last_date = self.last_dates.get(column)
+                if last_date is not None and date <= last_date:
+                    continue
+
+                # Only a date with at least one accepted value gets a row
+                value = float(value)
+                if date in self.frame.index:
+                    self.frame.at[date, column] = value
+                else:
+                    self.new_rows.setdefault(date, {})[column] = value
+                self.last_dates[column] = date
+                self.revision += 1
+                filled.append(column)
+
+                dates, values = points.setdefault(column, ([], []))
+                dates.append(date)
+                values.append(value)
+
+                if column in self.rolling_means:
+                    dates, values = rolling_means.setdefault(column, ([], []))
+                    dates.append(date)
+                    values.append(self.rolling_means[column].push(value))
+
+            # A pair only counts towards a correlation once both of its values are known
+            for (first_column, second_column), correlation in self.correlations.items():
+                if first_column not in filled and second_column not in filled:
+                    continue
+                x = self.value(date, first_column)
+                y = self.value(date, second_column)
+                if not pd.isna(x) and not pd.isna(y):
+                    correlation.push(x, y)
+
+        return points, rolling_means
+
+
+class SessionCache:
+    """
+    Keeps server-side state for each browser session, created with `create` the first
+    time a session is seen. Only the `max_sessions` most recently used sessions are
+    kept. The state lives in this process, so the app must run as a single process.
+    """
+
+    def __init__(self, create, max_sessions=32):
+        self.create = create
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_id):
+        with self.lock:
+            if session_id in self.sessions:
+                self.sessions.move_to_end(session_id)
+            else:
+                self.sessions[session_id] = self.create()
+                if len(self.sessions) > self.max_sessions:
+                    self.sessions.popitem(last=False)
+            return self.sessions[session_id]
+
+
+class FileTail:
+    """
+    Reads the rows appended to a local CSV file since the last read, like `tail -f`,
+    and returns them as bytes under the header of the file. Rows already in the file
+    when the tail is created are skipped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.header = None
+        self.offset = os.path.getsize(path) if os.path.exists(path) else 0
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return None
+
+        with open(self.path, "rb") as f:
+            if self.header is None:
+                self.header = f.readline()
+                self.offset = max(self.offset, f.tell())
+            if os.path.getsize(self.path) < self.offset:
+                # The file was truncated or replaced, so start again after its header
+                self.offset = len(self.header)
+            f.seek(self.offset)
+            data = f.read()
+
+        # Leave any partially written last line for the next read
+        data = data[: data.rfind(b"\n") + 1]
+        if not data.strip():
+            return None
+        self.offset += len(data)
+
+        return self.header + data